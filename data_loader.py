@@ -1,35 +1,143 @@
-import ollama
-from llama_index.readers.file import PDFReader
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+import numpy as np
+import orjson
+import pymupdf
+import requests
 from llama_index.core.node_parser import SentenceSplitter
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Using nomic-embed-text for embeddings (Ollama embedding model)
 # gemma3:1b is used for LLM, but we need a dedicated embedding model
 EMBED_MODEL = "nomic-embed-text"
 EMBED_DIM = 768  # nomic-embed-text produces 768-dimensional embeddings
+EMBED_BATCH_SIZE = 64  # texts per /api/embed request
+EMBED_MAX_CONCURRENT = 3  # /api/embed requests in flight at once
 
-# Initialize Ollama client (supports custom base URL via environment variable)
+# Ollama base URL (supports custom base URL via environment variable)
 ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11435")
-ollama_client = ollama.Client(host=ollama_base_url)
+
+# Shared session so batch requests reuse pooled keep-alive connections
+_session = requests.Session()
+_session.headers["Content-Type"] = "application/json"
+
+# On-disk cache of embeddings keyed by a hash of (model, text), so re-ingesting
+# the same content skips Ollama entirely
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".embed_cache.sqlite3")
+_cache_lock = threading.Lock()
+_cache_db: sqlite3.Connection | None = None
 
 splitter = SentenceSplitter(chunk_size=1000, chunk_overlap=200)
+# SentenceSplitter loads its sentence tokenizer lazily the first time a text
+# overflows a chunk; pay that once at import rather than on the first ingest.
+# Loading may download NLTK data, so a failure here must not stop the worker
+# booting: the first ingest just retries the load as before
+try:
+    splitter.split_text("Warm up the sentence tokenizer. " * splitter.chunk_size)
+except Exception:
+    logger.warning("Sentence splitter warm-up failed; it will load on first use", exc_info=True)
 
 def load_and_chunk_pdf(path: str):
-    docs = PDFReader().load_data(file=path)
-    texts = [d.text for d in docs if getattr(d, "text", None)]
-    chunks = []
-    for t in texts:
-        chunks.extend(splitter.split_text(t))
-    return chunks
-
-
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    """Generate embeddings using Ollama."""
-    embeddings = []
-    for text in texts:
-        response = ollama_client.embeddings(model=EMBED_MODEL, prompt=text)
-        embeddings.append(response["embedding"])
-    return embeddings
\ No newline at end of file
+    # PyMuPDF extracts text in C, far faster than the pure-Python pypdf behind PDFReader
+    with pymupdf.open(path) as doc:
+        texts = [t for t in (page.get_text("text") for page in doc) if t]
+    return splitter.split_texts(texts)
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    """Embed a batch via Ollama's /api/embed, halving it if it overflows the context."""
+    resp = _session.post(
+        f"{ollama_base_url}/api/embed",
+        data=orjson.dumps({"model": EMBED_MODEL, "input": texts}),
+        timeout=60,
+    )
+    # Ollama answers 400 "... exceeds the context length" when the batch is too big;
+    # any other 400 (bad model, malformed request) is raised straight away
+    if resp.status_code == 400 and len(texts) > 1 and "context length" in resp.text.lower():
+        mid = len(texts) // 2
+        return _embed_batch(texts[:mid]) + _embed_batch(texts[mid:])
+    resp.raise_for_status()
+    # A full batch is ~64 x 768 floats; orjson parses that much faster than stdlib json
+    return orjson.loads(resp.content)["embeddings"]
+
+
+def _cache_connection() -> sqlite3.Connection:
+    """Open the embedding cache on first use. Callers must hold _cache_lock."""
+    global _cache_db
+    if _cache_db is None:
+        Path(EMBED_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        _cache_db = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+        _cache_db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        _cache_db.commit()
+    return _cache_db
+
+
+def _cache_key(text: str) -> bytes:
+    return hashlib.blake2b(f"{EMBED_MODEL}\0{text}".encode(), digest_size=16).digest()
+
+
+def _embed_uncached(texts: list[str]) -> np.ndarray:
+    """Embed texts with Ollama, returning L2-normalized float32 rows."""
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    out = np.empty((len(texts), EMBED_DIM), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=EMBED_MAX_CONCURRENT) as executor:
+        # map() yields results in submission order, so rows stay aligned with texts
+        for i, (batch, batch_embeddings) in enumerate(zip(batches, executor.map(_embed_batch, batches))):
+            vectors = np.asarray(batch_embeddings, dtype=np.float32)
+            # out starts uninitialized, so a short or mis-shaped reply must not leave rows unfilled
+            if vectors.shape != (len(batch), EMBED_DIM):
+                raise ValueError(
+                    f"Ollama returned embeddings of shape {vectors.shape} for {len(batch)} texts, "
+                    f"expected ({len(batch)}, {EMBED_DIM})"
+                )
+            start = i * EMBED_BATCH_SIZE
+            out[start:start + len(batch)] = vectors
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    out /= np.where(norms == 0, 1, norms)
+    return out
+
+
+def _embed_cached(texts: list[str]) -> np.ndarray:
+    """Embed texts, serving cache hits from disk and sending only misses to Ollama."""
+    keys = [_cache_key(t) for t in texts]
+    out = np.empty((len(texts), EMBED_DIM), dtype=np.float32)
+    misses = []
+    with _cache_lock:
+        db = _cache_connection()
+        for i, key in enumerate(keys):
+            row = db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                misses.append(i)
+            else:
+                out[i] = np.frombuffer(row[0], dtype=np.float32)
+    if misses:
+        vectors = _embed_uncached([texts[i] for i in misses])
+        out[misses] = vectors
+        with _cache_lock:
+            db = _cache_connection()
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                ((keys[i], v.tobytes()) for i, v in zip(misses, vectors)),
+            )
+            db.commit()
+    return out
+
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """Generate L2-normalized embeddings as a (len(texts), EMBED_DIM) float32 array."""
+    # Repeated headers, footers and boilerplate are embedded once and fanned back out
+    unique = list(dict.fromkeys(texts))
+    vectors = _embed_cached(unique)
+    if len(unique) == len(texts):
+        return vectors
+    index = {t: i for i, t in enumerate(unique)}
+    return vectors[[index[t] for t in texts]]
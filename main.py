@@ -45,7 +45,7 @@ async def rag_ingest_pdf(ctx: inngest.Context):
     def _upsert(chunks_and_src: RAGChunkAndSrc) -> RAGUpsertResult:
         chunks = chunks_and_src.chunks
         source_id = chunks_and_src.source_id
-        vecs = embed_texts(chunks)
+        vecs = embed_texts(chunks).tolist()
         ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{i}")) for i in range(len(chunks))]
         payloads = [{"source": source_id, "text": chunks[i]} for i in range(len(chunks))]
         QdrantStorage().upsert(ids, vecs, payloads)
@@ -62,7 +62,7 @@ async def rag_ingest_pdf(ctx: inngest.Context):
 )
 async def rag_query_pdf_ai(ctx: inngest.Context):
     def _search(question: str, top_k: int = 5) -> RAGSearchResult:
-        query_vec = embed_texts([question])[0]
+        query_vec = embed_texts([question])[0].tolist()
         store = QdrantStorage()
         found = store.search(query_vec, top_k)
         return RAGSearchResult(contexts=found["contexts"], sources=found["sources"])
@@ -96,7 +96,9 @@ async def rag_query_pdf_ai(ctx: inngest.Context):
         return response["response"].strip()
 
     answer = await ctx.step.run("llm-answer", lambda: _generate_answer())
-    return {"answer": answer, "sources": found.sources, "num_contexts": len(found.contexts)}
+    # Only answer + sources (and a count) go into the run output the UI polls for;
+    # retrieved chunk text stays in the step data
+    return RAQQueryResult(answer=answer, sources=found.sources, num_contexts=len(found.contexts)).model_dump()
 
 app = FastAPI()
 
@@ -1,19 +1,36 @@
+from __future__ import annotations
+
 from pathlib import Path
+import logging
+import random
+import shutil
+import threading
 import time
+from typing import TYPE_CHECKING
 
 import streamlit as st
-import inngest
 from dotenv import load_dotenv
+import orjson
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+if TYPE_CHECKING:
+    # Imported lazily at runtime so the SDK load doesn't delay the first render
+    import inngest
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 st.set_page_config(page_title="RAG Ingest PDF", page_icon="📄", layout="centered")
 
 
 @st.cache_resource
 def get_inngest_client() -> inngest.Inngest:
+    import inngest
+
     # The Inngest SDK automatically reads from environment variables:
     # - INNGEST_API_BASE (defaults to http://127.0.0.1:8288/v1)
     # - INNGEST_EVENT_KEY (optional, for authentication)
@@ -33,15 +50,19 @@ def save_uploaded_pdf(file) -> Path:
     uploads_dir = Path("uploads")
     uploads_dir.mkdir(parents=True, exist_ok=True)
     file_path = uploads_dir / file.name
-    file_bytes = file.getbuffer()
-    file_path.write_bytes(file_bytes)
+    # Stream to disk in 1 MiB chunks; the upload itself is already held in memory by Streamlit
+    file.seek(0)
+    with file_path.open("wb") as f:
+        shutil.copyfileobj(file, f, length=1024 * 1024)
     return file_path
 
 
-def send_rag_ingest_event(pdf_path: Path) -> None:
+def send_rag_ingest_event(pdf_path: Path, client: inngest.Inngest | None = None) -> None:
     """Send RAG ingest event using Inngest SDK client."""
+    import inngest
+
     # Use the Inngest SDK client - it knows the correct endpoint
-    client = get_inngest_client()
+    client = client or get_inngest_client()
     
     try:
         # Use synchronous API to avoid conflicts with Streamlit's async runtime
@@ -67,21 +88,42 @@ def send_rag_ingest_event(pdf_path: Path) -> None:
         )
 
 
+def queue_rag_ingest_event(pdf_path: Path) -> None:
+    """Send RAG ingest event on a background thread so the UI doesn't wait on the round-trip."""
+    # Resolve the cached client and session state on the script thread, where
+    # Streamlit has a run context; the worker reports failures through the dict
+    client = get_inngest_client()
+    failures = st.session_state.setdefault("ingest_send_failures", {})
+
+    def _send() -> None:
+        try:
+            send_rag_ingest_event(pdf_path, client)
+        except Exception as e:
+            logger.exception("Failed to send ingest event for %s", pdf_path.name)
+            failures[pdf_path.name] = str(e)
+
+    threading.Thread(target=_send, daemon=True).start()
+
+
 st.title("Upload a PDF to Ingest")
 uploaded = st.file_uploader("Choose a PDF", type=["pdf"], accept_multiple_files=False)
 
+# Surface background send failures from earlier runs, once each
+failures = st.session_state.get("ingest_send_failures", {})
+for name in list(failures):
+    st.error(f"Failed to trigger ingestion for {name}: {failures.pop(name)}")
+
 if uploaded is not None:
     with st.spinner("Uploading and triggering ingestion..."):
         path = save_uploaded_pdf(uploaded)
-        # Kick off the event and block until the send completes
+        # Ingest is fire-and-forget: queue the event and let the UI move on
         try:
-            send_rag_ingest_event(path)
-            # Small pause for user feedback continuity
-            time.sleep(0.3)
-            st.success(f"Triggered ingestion for: {path.name}")
-            st.caption("You can upload another PDF if you like.")
+            queue_rag_ingest_event(path)
+            st.info(f"Sending ingestion request for: {path.name}")
+            st.caption("If the request fails, the error will show here on your next interaction. "
+                       "You can upload another PDF if you like.")
         except Exception as e:
-            st.error(f"Failed to trigger ingestion: {str(e)}")
+            st.error(f"Failed to queue ingestion: {str(e)}")
             st.caption("Please ensure the Inngest service is running and accessible.")
 
 st.divider()
@@ -90,6 +132,8 @@ st.title("Ask a question about your PDFs")
 
 def send_rag_query_event(question: str, top_k: int) -> str:
     """Send RAG query event using Inngest SDK client and return event ID."""
+    import inngest
+
     # Use the Inngest SDK client - it knows the correct endpoint
     client = get_inngest_client()
     
@@ -127,19 +171,53 @@ def _inngest_api_base() -> str:
     return os.getenv("INNGEST_API_BASE", "http://127.0.0.1:8288/v1")
 
 
-def fetch_runs(event_id: str) -> list[dict]:
+# Retries of a failed poll (502/503/504 or connection error) before it raises
+FETCH_RETRIES = 2
+FETCH_BACKOFF_FACTOR = 0.5
+# Total time urllib3 sleeps between attempts: nothing before the first retry,
+# then backoff_factor * 2 ** (n - 1) before retry n
+FETCH_BACKOFF_TOTAL_S = sum(FETCH_BACKOFF_FACTOR * 2 ** (n - 1) for n in range(2, FETCH_RETRIES + 1))
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    # Cached across Streamlit reruns so polls reuse keep-alive connections
+    # instead of paying a TCP handshake per request
+    session = requests.Session()
+    # Ride out transient gateway errors from the Inngest server instead of failing the poll
+    retry = Retry(total=FETCH_RETRIES, backoff_factor=FETCH_BACKOFF_FACTOR, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_runs(event_id: str, timeout_s: float = 15.0) -> list[dict]:
     url = f"{_inngest_api_base()}/events/{event_id}/runs"
-    resp = requests.get(url)
+    # Every attempt gets its own (connect, read) timeout, so take the retry
+    # backoff out of the budget and split the rest across attempts, with connect
+    # and read sharing each attempt's slice. A server that never accepts or never
+    # answers then gives up within about timeout_s in total
+    attempt_timeout_s = max(timeout_s - FETCH_BACKOFF_TOTAL_S, 0.3) / (FETCH_RETRIES + 1)
+    connect_timeout_s = min(2.0, attempt_timeout_s / 2)
+    resp = get_http_session().get(url, timeout=(connect_timeout_s, attempt_timeout_s - connect_timeout_s))
     resp.raise_for_status()
-    data = resp.json()
+    data = orjson.loads(resp.content)
     return data.get("data", [])
 
 
-def wait_for_run_output(event_id: str, timeout_s: float = 120.0, poll_interval_s: float = 0.5) -> dict:
-    start = time.time()
+def wait_for_run_output(
+    event_id: str,
+    timeout_s: float = 120.0,
+    base_delay_s: float = 0.1,
+    max_delay_s: float = 2.0,
+) -> dict:
+    deadline = time.time() + timeout_s
     last_status = None
+    attempt = 0
     while True:
-        runs = fetch_runs(event_id)
+        # Keep a single fetch (retries included) within what's left of the deadline
+        runs = fetch_runs(event_id, timeout_s=min(15.0, max(deadline - time.time(), 1.0)))
         if runs:
             run = runs[0]
             status = run.get("status")
@@ -148,9 +226,13 @@ def wait_for_run_output(event_id: str, timeout_s: float = 120.0, poll_interval_s
                 return run.get("output") or {}
             if status in ("Failed", "Cancelled"):
                 raise RuntimeError(f"Function run {status}")
-        if time.time() - start > timeout_s:
+        remaining = deadline - time.time()
+        if remaining <= 0:
             raise TimeoutError(f"Timed out waiting for run output (last status: {last_status})")
-        time.sleep(poll_interval_s)
+        # Exponential backoff with jitter: short runs return fast, long runs poll less often
+        delay = min(max_delay_s, base_delay_s * 2 ** attempt)
+        time.sleep(min(remaining, delay + random.uniform(0, delay * 0.1)))
+        attempt += 1
 
 
 with st.form("rag_query_form"):
@@ -165,13 +247,18 @@ with st.form("rag_query_form"):
                 event_id = send_rag_query_event(question.strip(), int(top_k))
                 # Poll the local Inngest API for the run's output
                 output = wait_for_run_output(event_id)
-                answer = output.get("answer", "")
-                sources = output.get("sources", [])
             except Exception as e:
                 st.error(f"Failed to query: {str(e)}")
                 st.caption("Please ensure the Inngest service is running and accessible.")
-                answer = ""
-                sources = []
+                output = {}
+        # A finished run's output never changes: keep only the latest one so
+        # widget-driven reruns re-render it without sending or polling again
+        st.session_state["last_query_output"] = output
+
+    if "last_query_output" in st.session_state:
+        output = st.session_state["last_query_output"]
+        answer = output.get("answer", "")
+        sources = output.get("sources", [])
 
         st.subheader("Answer")
         st.write(answer or "(No answer)")